@@ -3,11 +3,11 @@ import pandas as pd
 from database_optimized import StockDatabase
 from data_fetcher import DataFetcher
 from screening_optimized import StockScreener
-from visualize import plot_top_5_stocks, plot_breakout_stocks
-import time
+from visualize import plot_top_5_stocks, plot_breakout_stocks, load_stock_data
+import asyncio
 import logging
-from typing import List, Dict, Optional
-from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Tuple
+from datetime import date, datetime, timedelta
 
 # 配置
 DB_PATH = "stocks_optimized.db"
@@ -23,6 +23,29 @@ def init_components():
 
 db, fetcher, screener = init_components()
 
+@st.cache_data(ttl=3600, show_spinner=False)
+def run_screening(
+    _screener: StockScreener,
+    tickers: Tuple[str, ...],
+    prior_days: int,
+    consol_days: int,
+    min_rise_22: float,
+    min_rise_67: float,
+    max_range: float,
+    min_adr: float,
+    as_of: date
+) -> pd.DataFrame:
+    """運行篩選（按股票列表、參數及日期緩存，_screener 不參與哈希）"""
+    return _screener.screen_stocks(
+        list(tickers),
+        prior_days=prior_days,
+        consol_days=consol_days,
+        min_rise_22=min_rise_22,
+        min_rise_67=min_rise_67,
+        max_range=max_range,
+        min_adr=min_adr
+    )
+
 # 頁面佈局
 st.title("優化版 Qullamaggie Breakout Screener")
 
@@ -79,28 +102,87 @@ with st.sidebar.form("screening_params"):
     submit = st.form_submit_button("運行篩選")
 
 # 數據更新邏輯
+FETCH_CONCURRENCY = 16  # 同時進行的網絡請求數
+WRITE_QUEUE_SIZE = 64   # 待寫入隊列上限（背壓）
+WRITE_BATCH_SIZE = 50   # 每個寫入事務包含的股票數
+
 def update_tickers(tickers: List[str]):
     """更新指定股票的數據"""
     progress_bar = st.progress(0)
     status_text = st.empty()
+    end_date = datetime.now().strftime('%Y-%m-%d')
     
-    for i, ticker in enumerate(tickers):
-        status_text.text(f"正在更新 {ticker} ({i+1}/{len(tickers)})...")
-        progress_bar.progress((i + 1) / len(tickers))
-        
-        # 獲取最後更新日期
+    # 按開始日期分組，同組股票可合併為批量請求
+    groups: Dict[str, List[str]] = {}
+    for ticker in tickers:
         last_updated = db.get_ticker_last_updated(ticker)
         start_date = (
             (last_updated + timedelta(days=1)).strftime('%Y-%m-%d')
             if last_updated else '2020-01-01'  # 提供默認開始日期
         )
-        end_date = datetime.now().strftime('%Y-%m-%d')
+        groups.setdefault(start_date, []).append(ticker)
+    
+    done = 0
+    def advance(ticker: str):
+        nonlocal done
+        done += 1
+        status_text.text(f"正在更新 {ticker} ({done}/{len(tickers)})...")
+        progress_bar.progress(done / len(tickers))
+    
+    async def run():
+        """並發獲取（生產者）+ 單一寫入協程（消費者），SQLite 寫入保持單線程"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+        semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
         
-        # 從API獲取數據
-        data, source = fetcher.fetch_data(ticker, start_date, end_date)
-        if data is not None:
-            db.update_ticker_data(ticker, data, source)
-            time.sleep(0.5)  # 避免觸發API限制
+        async def fetch_and_enqueue(chunk: List[str], start_date: str):
+            async with semaphore:
+                batch = await asyncio.to_thread(
+                    fetcher.fetch_batch, chunk, start_date, end_date
+                )
+            
+            # 批量結果缺失的股票回退到多數據源獲取
+            async def fetch_one(ticker: str):
+                if ticker in batch:
+                    data, source = batch[ticker], 'yfinance'
+                else:
+                    async with semaphore:
+                        data, source = await fetcher.fetch_data_async(
+                            ticker, start_date, end_date
+                        )
+                await queue.put((ticker, data, source))
+            
+            await asyncio.gather(*(fetch_one(ticker) for ticker in chunk))
+        
+        async def produce():
+            await asyncio.gather(*(
+                fetch_and_enqueue(group[i:i + fetcher.BATCH_SIZE], start_date)
+                for start_date, group in groups.items()
+                for i in range(0, len(group), fetcher.BATCH_SIZE)
+            ))
+            await queue.put(None)
+        
+        async def db_writer():
+            # 寫入放入線程執行，避免阻塞事件循環中的獲取；逐批 await 仍保持單一寫入者
+            updates = []
+            while (item := await queue.get()) is not None:
+                ticker, data, source = item
+                if data is not None:
+                    updates.append(item)
+                advance(ticker)
+                if len(updates) >= WRITE_BATCH_SIZE:
+                    await asyncio.to_thread(db.update_many, updates)
+                    updates = []
+            if updates:
+                await asyncio.to_thread(db.update_many, updates)
+        
+        async with fetcher.async_session():
+            await asyncio.gather(produce(), db_writer())
+    
+    asyncio.run(run())
+    
+    # 數據已變更，清除篩選及圖表緩存
+    run_screening.clear()
+    load_stock_data.clear()
     
     status_text.success("更新完成！")
     progress_bar.empty()
@@ -131,15 +213,17 @@ if submit:
         
         st.session_state['tickers'] = tickers
         
-        # 運行篩選
-        results = screener.screen_stocks(
-            tickers,
+        # 運行篩選（參數未變時直接命中緩存）
+        results = run_screening(
+            screener,
+            tuple(sorted(tickers)),
             prior_days=st.session_state.prior_days,
             consol_days=st.session_state.consol_days,
             min_rise_22=st.session_state.min_rise_22,
             min_rise_67=st.session_state.min_rise_67,
             max_range=st.session_state.max_range,
-            min_adr=st.session_state.min_adr
+            min_adr=st.session_state.min_adr,
+            as_of=date.today()
         )
         
         if not results.empty:
@@ -1,8 +1,12 @@
 import yfinance as yf
 from alpha_vantage.timeseries import TimeSeries
-from typing import Dict, Optional, Tuple
+from alpha_vantage.async_support.timeseries import TimeSeries as AsyncTimeSeries
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from contextlib import asynccontextmanager
 import pandas as pd
 from datetime import datetime
+import asyncio
+import threading
 import time
 import logging
 
@@ -11,10 +15,17 @@ logger = logging.getLogger(__name__)
 class DataFetcher:
     """多源股票數據獲取器"""
     
+    # yfinance 單次批量請求的股票數量上限
+    BATCH_SIZE = 20
+    # yf.download 使用模塊級共享狀態，並發調用會互相覆蓋結果，需串行化
+    _yf_lock = threading.Lock()
+    
     def __init__(self, alpha_vantage_key: Optional[str] = None):
         self.alpha_vantage_key = alpha_vantage_key
         self.source_priority = ['yfinance', 'alpha_vantage']
         self.source_stats = {source: 0 for source in self.source_priority}
+        # 異步 Alpha Vantage 客戶端（持有 aiohttp 會話），僅在 async_session 期間存在
+        self._av_client: Optional[AsyncTimeSeries] = None
         
     def fetch_data(
         self, 
@@ -28,6 +39,7 @@ class DataFetcher:
         for attempt in range(retries):
             for source in self.source_priority:
                 try:
+                    data = None
                     if source == 'yfinance':
                         data = self._fetch_yfinance(ticker, start_date, end_date)
                     elif source == 'alpha_vantage' and self.alpha_vantage_key:
@@ -46,6 +58,86 @@ class DataFetcher:
         logger.error(f"All attempts failed for {ticker}")
         return None, "failed"
     
+    async def fetch_data_async(
+        self,
+        ticker: str,
+        start_date: str,
+        end_date: str,
+        retries: int = 3,
+        delay: float = 1.0
+    ) -> Tuple[Optional[pd.DataFrame], str]:
+        """異步從多個數據源獲取股票數據（失敗時指數退避重試）"""
+        for attempt in range(retries):
+            for source in self.source_priority:
+                try:
+                    data = None
+                    if source == 'yfinance':
+                        # yfinance 無異步接口，放入線程池避免阻塞事件循環
+                        data = await asyncio.to_thread(
+                            self._fetch_yfinance, ticker, start_date, end_date
+                        )
+                    elif source == 'alpha_vantage' and self.alpha_vantage_key:
+                        data = await self._fetch_alpha_vantage_async(
+                            ticker, start_date, end_date
+                        )
+                    
+                    if data is not None and not data.empty:
+                        self.source_stats[source] += 1
+                        return data, source
+                        
+                except Exception as e:
+                    logger.warning(
+                        f"Attempt {attempt + 1} failed with {source}: {str(e)}"
+                    )
+            if attempt < retries - 1:
+                await asyncio.sleep(delay * 2 ** attempt)
+        
+        logger.error(f"All attempts failed for {ticker}")
+        return None, "failed"
+    
+    @asynccontextmanager
+    async def async_session(self) -> AsyncIterator['DataFetcher']:
+        """在當前事件循環內共用一個 Alpha Vantage 異步客戶端（aiohttp 會話）"""
+        if self.alpha_vantage_key:
+            self._av_client = AsyncTimeSeries(
+                key=self.alpha_vantage_key, output_format='pandas'
+            )
+        try:
+            yield self
+        finally:
+            # aiohttp 會話綁定於當前事件循環，結束時關閉
+            if self._av_client is not None:
+                await self._av_client.close()
+                self._av_client = None
+    
+    def fetch_batch(
+        self,
+        tickers: List[str],
+        start_date: str,
+        end_date: str
+    ) -> Dict[str, pd.DataFrame]:
+        """從yfinance批量獲取多隻股票數據（每批最多 BATCH_SIZE 隻）"""
+        result = {}
+        downloaded = 0
+        for i in range(0, len(tickers), self.BATCH_SIZE):
+            chunk = tickers[i:i + self.BATCH_SIZE]
+            try:
+                data = self._download_yfinance(chunk, start_date, end_date)
+            except Exception as e:
+                logger.error(f"yfinance batch failed for {chunk}: {str(e)}")
+                continue
+            
+            if data.empty:
+                continue
+            
+            for ticker, df in self._split_yfinance(data, chunk).items():
+                if not df.empty:
+                    result[ticker] = df
+                    downloaded += 1
+        
+        self.source_stats['yfinance'] += downloaded
+        return result
+    
     def _fetch_yfinance(
         self, 
         ticker: str, 
@@ -54,17 +146,44 @@ class DataFetcher:
     ) -> Optional[pd.DataFrame]:
         """從yfinance獲取數據"""
         try:
-            data = yf.download(
-                ticker, 
-                start=start_date, 
-                end=end_date,
-                progress=False,
-                threads=True
-            )
-            return data if not data.empty else None
+            data = self._download_yfinance([ticker], start_date, end_date)
         except Exception as e:
             logger.error(f"yfinance failed for {ticker}: {str(e)}")
             return None
+        if data.empty:
+            return None
+        data = self._split_yfinance(data, [ticker]).get(ticker)
+        return data if data is not None and not data.empty else None
+    
+    def _download_yfinance(
+        self,
+        tickers: List[str],
+        start_date: str,
+        end_date: str
+    ) -> pd.DataFrame:
+        """調用 yf.download（批量與單股票共用參數，保留 Adj Close 欄位）"""
+        with self._yf_lock:
+            return yf.download(
+                " ".join(tickers),
+                start=start_date,
+                end=end_date,
+                group_by='ticker',
+                auto_adjust=False,
+                threads=True,
+                progress=False
+            )
+    
+    @staticmethod
+    def _split_yfinance(data: pd.DataFrame, tickers: List[str]) -> Dict[str, pd.DataFrame]:
+        """拆分 MultiIndex 欄位為單股票 DataFrame，並去除全空行"""
+        if isinstance(data.columns, pd.MultiIndex):
+            frames = {
+                ticker: data[ticker]
+                for ticker in data.columns.get_level_values(0).unique()
+            }
+        else:
+            frames = {tickers[0]: data}
+        return {ticker: df.dropna(how='all') for ticker, df in frames.items()}
     
     def _fetch_alpha_vantage(self, ticker: str) -> Optional[pd.DataFrame]:
         """從Alpha Vantage獲取數據"""
@@ -77,19 +196,53 @@ class DataFetcher:
                 symbol=ticker, 
                 outputsize='full'
             )
-            data = data.rename(columns={
-                '1. open': 'Open',
-                '2. high': 'High',
-                '3. low': 'Low',
-                '4. close': 'Close',
-                '5. adjusted close': 'Adj Close',
-                '6. volume': 'Volume'
-            })
+            data = self._format_alpha_vantage(data)
             return data if not data.empty else None
         except Exception as e:
             logger.error(f"Alpha Vantage failed for {ticker}: {str(e)}")
             return None
     
+    async def _fetch_alpha_vantage_async(
+        self,
+        ticker: str,
+        start_date: str,
+        end_date: str
+    ) -> Optional[pd.DataFrame]:
+        """異步從Alpha Vantage獲取數據"""
+        if not self.alpha_vantage_key:
+            return None
+        
+        ts = self._av_client or AsyncTimeSeries(
+            key=self.alpha_vantage_key, output_format='pandas'
+        )
+        try:
+            data, _ = await ts.get_daily_adjusted(
+                symbol=ticker,
+                outputsize='full'
+            )
+        except Exception as e:
+            logger.error(f"Alpha Vantage failed for {ticker}: {str(e)}")
+            return None
+        finally:
+            if ts is not self._av_client:
+                await ts.close()
+        
+        data = self._format_alpha_vantage(data).loc[start_date:end_date]
+        return data if not data.empty else None
+    
+    @staticmethod
+    def _format_alpha_vantage(data: pd.DataFrame) -> pd.DataFrame:
+        """統一Alpha Vantage欄位名稱，並按日期升序排列"""
+        data = data.rename(columns={
+            '1. open': 'Open',
+            '2. high': 'High',
+            '3. low': 'Low',
+            '4. close': 'Close',
+            '5. adjusted close': 'Adj Close',
+            '6. volume': 'Volume'
+        })
+        return data.sort_index()
+    
     def get_source_stats(self) -> Dict[str, int]:
         """獲取各數據源使用統計"""
         return self.source_stats
@@ -1,11 +1,15 @@
 import sqlite3
 import pandas as pd
 import numpy as np
-from functools import lru_cache
+from numba import njit
+from numpy.lib.stride_tricks import sliding_window_view
+from itertools import chain
 from datetime import datetime, timedelta
 import threading
+import queue
 import logging
-from typing import List, Dict, Optional, Tuple
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Dict, Optional, Sequence, Tuple
 
 # 配置日誌
 logging.basicConfig(
@@ -15,64 +19,206 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Date 欄位以 1970-01-01 起的天數（INTEGER）存儲
+EPOCH = datetime(1970, 1, 1)
+# SQL 中 TEXT 日期轉為 epoch 天數（儒略日 2440587.5 即 1970-01-01）
+SQL_TEXT_TO_EPOCH_DAY = "CAST(julianday({col}) - 2440587.5 AS INTEGER)"
+
+def _to_epoch_day(value) -> int:
+    """將日期（字符串或 datetime）轉為 epoch 天數"""
+    return (pd.Timestamp(value) - EPOCH).days
+
+def _rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    """滑動視窗平均（等同 rolling(window).mean()），前 window-1 行為 NaN"""
+    out = np.full(len(x), np.nan)
+    if len(x) >= window:
+        out[window - 1:] = sliding_window_view(x, window).mean(axis=-1)
+    return out
+
+@njit(cache=True)
+def _ema_nb(x: np.ndarray, span: int, seed: float = np.nan) -> np.ndarray:
+    """指數移動平均（等同 ewm(span, adjust=False).mean()），NaN 處沿用前值
+    
+    與 pandas 默認 ignore_na=False 一致：跨越 NaN 時前值權重按 (1 - alpha) 逐日衰減。
+    seed 為前一日的 EMA 值，用於在已有歷史後增量續算；為 NaN 時以首個值起算。
+    """
+    alpha = 2.0 / (span + 1)
+    out = np.empty(len(x))
+    prev = seed
+    old_wt = 1.0
+    for i in range(len(x)):
+        if np.isnan(x[i]):
+            if not np.isnan(prev):
+                old_wt *= 1 - alpha
+            out[i] = prev
+            continue
+        if np.isnan(prev):
+            prev = x[i]
+        else:
+            old_wt *= 1 - alpha
+            prev = (old_wt * prev + alpha * x[i]) / (old_wt + alpha)
+        old_wt = 1.0
+        out[i] = prev
+    return out
+
 class StockDatabase:
     """優化的股票數據庫類"""
     
+    # 每個連接首次打開時應用的 PRAGMA
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA mmap_size=268435456",
+        "PRAGMA cache_size=-65536",
+        "PRAGMA temp_store=MEMORY",
+    )
+    # 連接池大小（WAL 模式下多個讀連接可與寫入並發）
+    POOL_SIZE = 4
+    # 單次 IN 查詢的最大股票數（SQLite 默認參數上限為 999）
+    MAX_QUERY_TICKERS = 900
+    # 數據庫結構版本（記錄於 PRAGMA user_version）
+    SCHEMA_VERSION = 2
+    # stocks 表中 Date、Ticker 之後的數據欄位（按表結構順序）
+    DATA_COLUMNS = [
+        'Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume',
+        'MA10', 'EMA12', 'EMA26', 'MACD', 'MACD_Signal', 'MACD_Hist'
+    ]
+    # 讀取時降為 float32 的價格及指標欄位（約 7 位有效數字已足夠）
+    FLOAT32_COLUMNS = [
+        'Open', 'High', 'Low', 'Close', 'Adj Close',
+        'MA10', 'EMA12', 'EMA26', 'MACD', 'MACD_Signal', 'MACD_Hist'
+    ]
+    
     def __init__(self, db_path: str = "stocks_optimized.db"):
         self.db_path = db_path
+        self._pool: queue.Queue = queue.Queue(maxsize=self.POOL_SIZE)
+        for _ in range(self.POOL_SIZE):
+            self._pool.put(self._open_connection())
         self._init_db()
         self.lock = threading.Lock()
+        # 各股票最後更新日期（epoch 天數），啟動時一次性加載，寫入時同步更新
+        with self._connection() as conn:
+            self._last_updated: Dict[str, int] = dict(conn.execute(
+                "SELECT ticker, last_updated FROM metadata"
+            ).fetchall())
+    
+    def _open_connection(self) -> sqlite3.Connection:
+        """打開 autocommit 連接並設置 PRAGMA"""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            isolation_level=None
+        )
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """從連接池借出連接，用畢歸還（池空時阻塞等待）"""
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
         
     def _init_db(self):
         """初始化數據庫結構"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            if version < self.SCHEMA_VERSION and self._table_exists(cursor, 'stocks'):
+                self._migrate(cursor, version)
+            
             # 創建主表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS stocks (
-                    Date TEXT, 
-                    Ticker TEXT, 
-                    Open REAL, 
-                    High REAL, 
-                    Low REAL, 
-                    Close REAL, 
-                    "Adj Close" REAL,  -- 改回 Adj Close
-                    Volume INTEGER,
-                    MA10 REAL,
-                    EMA12 REAL,
-                    EMA26 REAL,
-                    MACD REAL,
-                    MACD_Signal REAL,
-                    MACD_Hist REAL,
-                    PRIMARY KEY (Date, Ticker)
-                )
-            ''')
+            self._create_stocks_table(cursor, 'stocks')
             # 創建元數據表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS metadata (
-                    ticker TEXT PRIMARY KEY,
-                    last_updated TEXT,
-                    data_source TEXT
-                )
-            ''')
-            # 創建索引
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_ticker_date 
-                ON stocks (Ticker, Date)
-            ''')
-            conn.commit()
-    
-    @lru_cache(maxsize=1000)
-    def get_ticker_last_updated(self, ticker: str) -> Optional[datetime]:
-        """獲取股票最後更新時間（帶緩存）"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT last_updated FROM metadata WHERE ticker = ?",
-                (ticker,)
+            self._create_metadata_table(cursor, 'metadata')
+            cursor.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+    
+    @staticmethod
+    def _table_exists(cursor: sqlite3.Cursor, table: str) -> bool:
+        """檢查數據表是否存在"""
+        return cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (table,)
+        ).fetchone() is not None
+    
+    @staticmethod
+    def _create_stocks_table(cursor: sqlite3.Cursor, table: str):
+        """創建股票數據表
+        
+        以 (Ticker, Date) 為主鍵的 WITHOUT ROWID 表，同一股票的歷史數據
+        在 B-tree 中連續存放，按股票讀取區間時為順序掃描而非按 rowid 隨機回表。
+        """
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                Date INTEGER,  -- 1970-01-01 起的天數
+                Ticker TEXT, 
+                Open REAL, 
+                High REAL, 
+                Low REAL, 
+                Close REAL, 
+                "Adj Close" REAL,  -- 改回 Adj Close
+                Volume INTEGER,
+                MA10 REAL,
+                EMA12 REAL,
+                EMA26 REAL,
+                MACD REAL,
+                MACD_Signal REAL,
+                MACD_Hist REAL,
+                PRIMARY KEY (Ticker, Date)
+            ) WITHOUT ROWID
+        ''')
+    
+    @staticmethod
+    def _create_metadata_table(cursor: sqlite3.Cursor, table: str):
+        """創建元數據表（last_updated 同為 epoch 天數）"""
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                ticker TEXT PRIMARY KEY,
+                last_updated INTEGER,
+                data_source TEXT
             )
-            result = cursor.fetchone()
-            return datetime.strptime(result[0], '%Y-%m-%d') if result else None
+        ''')
+    
+    def _migrate(self, cursor: sqlite3.Cursor, version: int):
+        """將舊版本數據庫結構遷移至 SCHEMA_VERSION"""
+        logger.info(f"Migrating {self.db_path} from schema v{version} to v{self.SCHEMA_VERSION}")
+        cursor.execute("BEGIN")
+        try:
+            if version < 2:
+                # v1: 主表改為按 (Ticker, Date) 聚簇的 WITHOUT ROWID 表
+                # v2: Date / last_updated 由 TEXT 改為 epoch 天數
+                self._create_stocks_table(cursor, 'stocks_new')
+                cursor.execute(f'''
+                    INSERT INTO stocks_new
+                    SELECT {SQL_TEXT_TO_EPOCH_DAY.format(col='Date')}, Ticker,
+                           Open, High, Low, Close, "Adj Close", Volume,
+                           MA10, EMA12, EMA26, MACD, MACD_Signal, MACD_Hist
+                    FROM stocks
+                ''')
+                cursor.execute("DROP TABLE stocks")
+                cursor.execute("ALTER TABLE stocks_new RENAME TO stocks")
+                
+                if self._table_exists(cursor, 'metadata'):
+                    self._create_metadata_table(cursor, 'metadata_new')
+                    cursor.execute(f'''
+                        INSERT INTO metadata_new
+                        SELECT ticker, {SQL_TEXT_TO_EPOCH_DAY.format(col='last_updated')}, data_source
+                        FROM metadata
+                    ''')
+                    cursor.execute("DROP TABLE metadata")
+                    cursor.execute("ALTER TABLE metadata_new RENAME TO metadata")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    
+    def get_ticker_last_updated(self, ticker: str) -> Optional[datetime]:
+        """獲取股票最後更新時間（讀取內存字典）"""
+        last_updated = self._last_updated.get(ticker)
+        return EPOCH + timedelta(days=last_updated) if last_updated is not None else None
     
     def update_ticker_data(
         self, 
@@ -81,69 +227,146 @@ class StockDatabase:
         data_source: str = 'yfinance'
     ) -> bool:
         """更新單個股票數據（增量更新）"""
-        if data.empty:
-            return False
-            
-        with self.lock, sqlite3.connect(self.db_path) as conn:
+        return self.update_many([(ticker, data, data_source)]) == 1
+    
+    def update_many(
+        self,
+        items: Iterable[Tuple[str, pd.DataFrame, str]]
+    ) -> int:
+        """在單個事務中批量更新多隻股票數據，返回成功寫入的股票數"""
+        # 先在內存中計算全部股票的記錄，再以單次 executemany 寫入
+        # 單隻股票數據異常時記錄並跳過，不影響同批其他股票
+        prepared = []
+        for ticker, data, data_source in items:
+            try:
+                records = self._prepare_records(ticker, data)
+            except Exception as e:
+                logger.error(f"Error preparing data for {ticker}: {str(e)}")
+                continue
+            if records:
+                prepared.append((ticker, data_source, records))
+        
+        with self.lock, self._connection() as conn:
             cursor = conn.cursor()
-            
-            # 計算技術指標
-            data['MA10'] = data['Close'].rolling(10).mean()
-            data['EMA12'] = data['Close'].ewm(span=12, adjust=False).mean()
-            data['EMA26'] = data['Close'].ewm(span=26, adjust=False).mean()
-            data['MACD'] = data['EMA12'] - data['EMA26']
-            data['MACD_Signal'] = data['MACD'].ewm(span=9, adjust=False).mean()
-            data['MACD_Hist'] = data['MACD'] - data['MACD_Signal']
-            
-            # 轉換為適合插入的格式
-            records = [
-                (
-                    date.strftime('%Y-%m-%d'), ticker,
-                    row['Open'], row['High'], row['Low'], 
-                    row['Close'], row['Adj Close'], row['Volume'],  # -- 改回 Adj Close
-                    row['MA10'], row['EMA12'], row['EMA26'],
-                    row['MACD'], row['MACD_Signal'], row['MACD_Hist']
+            # 連接為 autocommit 模式，需顯式開啟事務；所有股票共用一次提交
+            cursor.execute("BEGIN")
+            try:
+                self._insert_rows(
+                    cursor,
+                    chain.from_iterable(records for _, _, records in prepared)
                 )
-                for date, row in data.iterrows()
-            ]
-            
-            # 批量插入
-            cursor.executemany('''
-                INSERT OR REPLACE INTO stocks 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', records)
-            
-            # 更新元數據
-            last_date = data.index[-1].strftime('%Y-%m-%d')
-            cursor.execute('''
-                INSERT OR REPLACE INTO metadata 
-                VALUES (?, ?, ?)
-            ''', (ticker, last_date, data_source))
+                # 更新元數據
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO metadata 
+                    VALUES (?, ?, ?)
+                ''', [
+                    (ticker, records[-1][0], data_source)
+                    for ticker, data_source, records in prepared
+                ])
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
             
-            conn.commit()
-            return True
+            for ticker, _, records in prepared:
+                self._last_updated[ticker] = records[-1][0]
+            return len(prepared)
+    
+    @staticmethod
+    def _insert_rows(cursor: sqlite3.Cursor, rows: Iterable[tuple]):
+        """以單條預編譯語句批量插入所有股票的行（由調用方管理事務）"""
+        cursor.executemany('''
+            INSERT OR REPLACE INTO stocks 
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+    
+    def _prepare_records(self, ticker: str, data: pd.DataFrame) -> List[tuple]:
+        """計算技術指標並轉換為待插入的記錄"""
+        if data.empty:
+            return []
+        
+        dates = data.index.values.astype('datetime64[D]').astype(np.int64).tolist()
+        
+        # 計算技術指標：從數據庫已有的最後狀態續算，只遍歷新數據
+        prev_closes, prev_ema12, prev_ema26, prev_signal = self._indicator_state(
+            ticker, dates[0]
+        )
+        close = data['Close'].to_numpy(dtype=float)
+        data['MA10'] = _rolling_mean(
+            np.concatenate([prev_closes, close]), 10
+        )[len(prev_closes):]
+        ema12 = _ema_nb(close, 12, prev_ema12)
+        ema26 = _ema_nb(close, 26, prev_ema26)
+        macd = ema12 - ema26
+        macd_signal = _ema_nb(macd, 9, prev_signal)
+        data['EMA12'] = ema12
+        data['EMA26'] = ema26
+        data['MACD'] = macd
+        data['MACD_Signal'] = macd_signal
+        data['MACD_Hist'] = macd - macd_signal
+        
+        # 轉換為適合插入的格式（日期已向量化轉換為 epoch 天數，避免 iterrows）
+        columns = data[self.DATA_COLUMNS]
+        return [
+            (date, ticker, *row)
+            for date, row in zip(dates, columns.itertuples(index=False, name=None))
+        ]
+    
+    def _indicator_state(
+        self,
+        ticker: str,
+        before: int
+    ) -> Tuple[np.ndarray, float, float, float]:
+        """讀取指定日期前的指標狀態：最近 9 個收盤價（MA10 用）及最後的 EMA12、EMA26、MACD_Signal"""
+        with self._connection() as conn:
+            rows = conn.execute('''
+                SELECT Close, EMA12, EMA26, MACD_Signal FROM stocks
+                WHERE Ticker = ? AND Date < ?
+                ORDER BY Date DESC
+                LIMIT 9
+            ''', (ticker, before)).fetchall()
+        if not rows:
+            return np.empty(0), np.nan, np.nan, np.nan
+        
+        _, ema12, ema26, signal = (np.nan if v is None else v for v in rows[0])
+        closes = np.array([np.nan if r[0] is None else r[0] for r in reversed(rows)])
+        return closes, ema12, ema26, signal
     
     def fetch_stock_data(
         self, 
         tickers: List[str], 
         start_date: str, 
-        end_date: str
+        end_date: str,
+        columns: Optional[Sequence[str]] = None
     ) -> Dict[str, pd.DataFrame]:
-        """從數據庫獲取股票數據"""
+        """從數據庫獲取股票數據，columns 指定只讀取的數據欄位（默認全部）"""
+        columns = list(columns) if columns is not None else self.DATA_COLUMNS
+        unknown = set(columns) - set(self.DATA_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown columns: {sorted(unknown)}")
+        select = ", ".join(['Date', 'Ticker'] + [f'"{col}"' for col in columns])
+        float32_columns = [col for col in self.FLOAT32_COLUMNS if col in columns]
+        
         result = {}
-        with sqlite3.connect(self.db_path) as conn:
-            for ticker in tickers:
-                query = '''
-                    SELECT * FROM stocks 
-                    WHERE Ticker = ? AND Date BETWEEN ? AND ?
-                    ORDER BY Date
+        with self._connection() as conn:
+            # 單次 IN 查詢取代逐個股票查詢，分塊以避免超出 SQLite 參數上限
+            for i in range(0, len(tickers), self.MAX_QUERY_TICKERS):
+                chunk = tickers[i:i + self.MAX_QUERY_TICKERS]
+                qmarks = ",".join("?" * len(chunk))
+                query = f'''
+                    SELECT {select} FROM stocks 
+                    WHERE Ticker IN ({qmarks}) AND Date BETWEEN ? AND ?
+                    ORDER BY Ticker, Date
                 '''
                 df = pd.read_sql_query(
                     query, conn, 
-                    params=(ticker, start_date, end_date),
-                    parse_dates=['Date'],
-                    index_col='Date'
+                    params=(*chunk, _to_epoch_day(start_date), _to_epoch_day(end_date))
                 )
-                if not df.empty:
-                    result[ticker] = df
+                df['Date'] = pd.to_datetime(df['Date'], unit='D')
+                # 降低精度以減半後續計算的內存帶寬
+                df[float32_columns] = df[float32_columns].astype('float32')
+                if 'Volume' in columns:
+                    df['Volume'] = pd.to_numeric(df['Volume'], downcast='integer')
+                for ticker, group in df.groupby('Ticker', sort=False):
+                    result[ticker] = group.set_index('Date')
         return result
@@ -1,11 +1,102 @@
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Tuple, Optional
-from concurrent.futures import ThreadPoolExecutor
+from numba import njit
 import logging
 
 logger = logging.getLogger(__name__)
 
+@njit(cache=True)
+def _shift_nb(x: np.ndarray, periods: int) -> np.ndarray:
+    """按位置向後平移（等同 Series.shift），前段補 NaN"""
+    out = np.full(len(x), np.nan, dtype=x.dtype)
+    for i in range(periods, len(x)):
+        out[i] = x[i - periods]
+    return out
+
+@njit(cache=True)
+def _rolling_mean_nb(x: np.ndarray, window: int) -> np.ndarray:
+    """單次遍歷累加的滾動平均，視窗內含 NaN 時輸出 NaN"""
+    n = len(x)
+    out = np.full(n, np.nan, dtype=x.dtype)
+    total = 0.0
+    nan_count = 0
+    for i in range(n):
+        if np.isnan(x[i]):
+            nan_count += 1
+        else:
+            total += x[i]
+        if i >= window:
+            if np.isnan(x[i - window]):
+                nan_count -= 1
+            else:
+                total -= x[i - window]
+        if i >= window - 1 and nan_count == 0:
+            out[i] = total / window
+    return out
+
+@njit(cache=True)
+def _rolling_extreme_nb(x: np.ndarray, window: int, use_max: bool) -> np.ndarray:
+    """單調隊列計算滾動最大/最小值，O(N)，視窗內含 NaN 時輸出 NaN"""
+    n = len(x)
+    out = np.full(n, np.nan, dtype=x.dtype)
+    queue = np.empty(n, dtype=np.int64)
+    head = 0
+    tail = 0
+    last_nan = -window
+    for i in range(n):
+        value = x[i]
+        if np.isnan(value):
+            last_nan = i
+            head = 0
+            tail = 0
+            continue
+        while tail > head and (
+            x[queue[tail - 1]] <= value if use_max else x[queue[tail - 1]] >= value
+        ):
+            tail -= 1
+        queue[tail] = i
+        tail += 1
+        if queue[head] <= i - window:
+            head += 1
+        if i >= window - 1 and i - last_nan >= window:
+            out[i] = x[queue[head]]
+    return out
+
+@njit(cache=True, error_model='numpy')
+def _compute_signals_nb(
+    close: np.ndarray,
+    high: np.ndarray,
+    low: np.ndarray,
+    volume: np.ndarray,
+    prior_days: int,
+    consol_days: int
+):
+    """計算篩選指標，返回 (rise_22, rise_67, consol_range, adr, breakout, breakout_volume, mask)，
+    mask 標記所有指標均已有足夠歷史數據的行"""
+    n = len(close)
+    prev_close = _shift_nb(close, 1)
+    rise_22 = (close / _shift_nb(close, 22) - 1) * 100
+    rise_67 = (close / _shift_nb(close, 67) - 1) * 100
+    recent_high = _rolling_extreme_nb(close, consol_days, True)
+    recent_low = _rolling_extreme_nb(close, consol_days, False)
+    consol_range = (recent_high / recent_low - 1) * 100
+    adr = _rolling_mean_nb((high - low) / prev_close, prior_days) * 100
+    avg_volume = _rolling_mean_nb(volume, 10)
+    
+    breakout = np.zeros(n, dtype=np.bool_)
+    breakout_volume = np.zeros(n, dtype=np.bool_)
+    mask = np.zeros(n, dtype=np.bool_)
+    for i in range(1, n):
+        prev_high = recent_high[i - 1]
+        breakout[i] = close[i] > prev_high and prev_close[i] <= prev_high
+        breakout_volume[i] = volume[i] > avg_volume[i] * 1.5
+        mask[i] = not (
+            np.isnan(rise_22[i]) or np.isnan(rise_67[i])
+            or np.isnan(consol_range[i]) or np.isnan(adr[i])
+        )
+    return rise_22, rise_67, consol_range, adr, breakout, breakout_volume, mask
+
 class StockScreener:
     """優化的股票篩選器"""
     
@@ -20,43 +111,52 @@ class StockScreener:
         min_rise_22: float = 10.0,
         min_rise_67: float = 40.0,
         max_range: float = 10.0,
-        min_adr: float = 2.0,
-        max_workers: int = 4
+        min_adr: float = 2.0
     ) -> pd.DataFrame:
-        """多線程篩選股票"""
+        """篩選股票"""
         # 計算所需數據日期範圍
         end_date = pd.Timestamp.now().strftime('%Y-%m-%d')
         start_date = (pd.Timestamp.now() - pd.Timedelta(days=180)).strftime('%Y-%m-%d')
         
         # 批量獲取數據
-        stock_data = self.db.fetch_stock_data(tickers, start_date, end_date)  # 修正為 fetch_stock_data
+        stock_data = self.db.fetch_stock_data(  # 修正為 fetch_stock_data
+            tickers, start_date, end_date,
+            columns=['Close', 'High', 'Low', 'Volume']  # 篩選只需這些欄位
+        )
         
-        # 多線程分析
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
-            for ticker, data in stock_data.items():
-                futures.append(executor.submit(
-                    self._analyze_stock,
-                    ticker,
-                    data,
-                    prior_days,
-                    consol_days,
-                    min_rise_22,
-                    min_rise_67,
-                    max_range,
-                    min_adr
-                ))
-            
-            results = []
-            for future in futures:
-                try:
-                    result = future.result()
-                    if result is not None:
-                        results.append(result)
-                except Exception as e:
-                    logger.error(f"Analysis failed: {str(e)}")
+        # 分析為 numba 編譯的數值計算，線程受 GIL 限制無法加速，直接順序執行
+        results = []  # (ticker, 匹配行的各欄位數組)
+        for ticker, data in stock_data.items():
+            result = self._analyze_stock(
+                ticker,
+                data,
+                prior_days,
+                consol_days,
+                min_rise_22,
+                min_rise_67,
+                max_range,
+                min_adr
+            )
+            if result is not None:
+                results.append((ticker, result))
+        
+        if not results:
+            return pd.DataFrame()
+        
+        # 按各股票匹配行數預分配結果數組並分段填充，最後只構建一次 DataFrame
+        counts = [len(columns['Date']) for _, columns in results]
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        output = {'Ticker': np.empty(offsets[-1], dtype=object)}
+        for name in results[0][1]:
+            dtype = np.result_type(*(columns[name] for _, columns in results))
+            output[name] = np.empty(offsets[-1], dtype=dtype)
         
-        return pd.concat(results) if results else pd.DataFrame()
+        for (ticker, columns), start, end in zip(results, offsets[:-1], offsets[1:]):
+            output['Ticker'][start:end] = ticker
+            for name, values in columns.items():
+                output[name][start:end] = values
+        
+        return pd.DataFrame(output)
     
     def _analyze_stock(
         self,
@@ -68,46 +168,39 @@ class StockScreener:
         min_rise_67: float,
         max_range: float,
         min_adr: float
-    ) -> Optional[pd.DataFrame]:
-        """分析單個股票"""
+    ) -> Optional[Dict[str, np.ndarray]]:
+        """分析單個股票，返回符合條件各行的欄位數組"""
         try:
             if len(data) < (prior_days + consol_days + 30):
                 logger.warning(f"Insufficient data for {ticker}")
                 return None
             
-            close = data['Close']
-            volume = data['Volume']
-            high = data['High']
-            low = data['Low']
+            close = data['Close'].to_numpy(dtype=np.float32)
+            volume = data['Volume'].to_numpy(dtype=np.float32)
+            high = data['High'].to_numpy(dtype=np.float32)
+            low = data['Low'].to_numpy(dtype=np.float32)
             
             # 計算指標
-            rise_22 = (close / close.shift(22) - 1) * 100
-            rise_67 = (close / close.shift(67) - 1) * 100
-            recent_high = close.rolling(consol_days).max()
-            recent_low = close.rolling(consol_days).min()
-            consolidation_range = (recent_high / recent_low - 1) * 100
-            vol_decline = volume.rolling(consol_days).mean() < volume.shift(consol_days).rolling(prior_days).mean()
-            daily_range = (high - low) / close.shift(1)
-            adr = daily_range.rolling(prior_days).mean() * 100
-            breakout = (close > recent_high.shift(1)) & (close.shift(1) <= recent_high.shift(1))
-            breakout_volume = volume > volume.rolling(10).mean() * 1.5
+            (
+                rise_22, rise_67, consolidation_range, adr,
+                breakout, breakout_volume, valid
+            ) = _compute_signals_nb(close, high, low, volume, prior_days, consol_days)
             
-            # 應用篩選條件
-            mask = (
-                (rise_22 >= min_rise_22) & 
-                (rise_67 >= min_rise_67) & 
-                (consolidation_range <= max_range) & 
-                (adr >= min_adr)
-            )
+            # 應用篩選條件（單次歸約合併，避免逐個 & 產生中間數組）
+            mask = np.logical_and.reduce([
+                valid,
+                rise_22 >= min_rise_22,
+                rise_67 >= min_rise_67,
+                consolidation_range <= max_range,
+                adr >= min_adr
+            ])
             
             if not mask.any():
                 return None
                 
-            # 構建結果DataFrame
-            matched_dates = data.index[mask]
-            result = pd.DataFrame({
-                'Ticker': ticker,
-                'Date': matched_dates,
+            # 構建結果欄位（由 screen_stocks 統一組裝為 DataFrame）
+            result = {
+                'Date': data.index.to_numpy()[mask],
                 'Price': close[mask],
                 'Prior_Rise_22_%': rise_22[mask],
                 'Prior_Rise_67_%': rise_67[mask],
@@ -115,8 +208,8 @@ class StockScreener:
                 'ADR_%': adr[mask],
                 'Breakout': breakout[mask],
                 'Breakout_Volume': breakout_volume[mask],
-                'Volume': volume[mask]
-            })
+                'Volume': data['Volume'].to_numpy()[mask]
+            }
             
             return result
             
@@ -1,12 +1,18 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
+from typing import Dict, Tuple
 from plotly.subplots import make_subplots
 from database_optimized import StockDatabase  # 正確導入 StockDatabase 類
 
 # 初始化 StockDatabase
 db = StockDatabase("stocks_optimized.db")
 
+@st.cache_data(ttl=900)
+def load_stock_data(tickers: Tuple[str, ...], start_date: str, end_date: str) -> Dict[str, pd.DataFrame]:
+    """從數據庫讀取股票數據（按股票列表及日期範圍緩存）"""
+    return db.fetch_stock_data(list(tickers), start_date, end_date)
+
 def plot_top_5_stocks(top_5_tickers):
     """繪製前 5 名股票的走勢圖（包含股價、成交量、10 日均線和 MACD）"""
     stock_data_batch = st.session_state.get('stock_data', None)
@@ -18,10 +24,10 @@ def plot_top_5_stocks(top_5_tickers):
         if stock_data_batch is not None and ticker in stock_data_batch:
             stock_data = stock_data_batch[ticker]
         else:
-            # 使用 StockDatabase 的 fetch_stock_data 方法
+            # 使用 StockDatabase 的 fetch_stock_data 方法（帶緩存）
             end_date = pd.Timestamp.now().strftime('%Y-%m-%d')
             start_date = (pd.Timestamp.now() - pd.Timedelta(days=70)).strftime('%Y-%m-%d')
-            stock_data_dict = db.fetch_stock_data([ticker], start_date, end_date)
+            stock_data_dict = load_stock_data((ticker,), start_date, end_date)
             stock_data = stock_data_dict.get(ticker, pd.DataFrame())
         
         if stock_data.empty:
@@ -107,10 +113,10 @@ def plot_breakout_stocks(breakout_tickers, consol_days):
         if stock_data_batch is not None and ticker in stock_data_batch:
             stock_data = stock_data_batch[ticker]
         else:
-            # 使用 StockDatabase 的 fetch_stock_data 方法
+            # 使用 StockDatabase 的 fetch_stock_data 方法（帶緩存）
             end_date = pd.Timestamp.now().strftime('%Y-%m-%d')
             start_date = (pd.Timestamp.now() - pd.Timedelta(days=70)).strftime('%Y-%m-%d')
-            stock_data_dict = db.fetch_stock_data([ticker], start_date, end_date)
+            stock_data_dict = load_stock_data((ticker,), start_date, end_date)
             stock_data = stock_data_dict.get(ticker, pd.DataFrame())
         
         if stock_data.empty: